@@ -0,0 +1,473 @@
+"""
+Helpers shared by the scripts in this directory.
+
+The scripts are run as `python3 scripts/<name>.py`, which puts this
+directory on sys.path, so they can simply `import _ubuntu_common`.
+"""
+
+import copy
+import functools
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Default size of the HTTP connection pool
+MAX_WORKERS = 16
+
+# Parsed YAML files keyed by path, invalidated when mtime or size change
+YAML_CACHE_SIZE = 100
+_yaml_cache = OrderedDict()
+
+# JSON copies of parsed YAML files, one per YAML file path, each with a
+# hash of the YAML content it was made from
+CACHE_DIR = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'ubuntu-spins'
+YAML_SIDECAR_DIR = CACHE_DIR / 'yaml'
+
+RELEASE_CODENAMES_FILE = 'config/release_codenames.yaml'
+
+USER_AGENT = 'netbootxyz-ubuntu-spins (+https://github.com/netbootxyz/ubuntu-spins)'
+
+def create_session(pool_size=MAX_WORKERS):
+    """
+    Create an HTTP session that keeps connections to the CDN alive.
+    pool_size is the most requests the caller runs at the same time; the
+    pool keeps that many connections per host open for reuse.
+    """
+    # Imported here so scripts that never touch the network don't pay for it
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    retries = Retry(total=3, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+def write_text_atomic(path, text):
+    """
+    Replace a file's content by writing a temporary file next to it and
+    renaming it over the original, so an interrupted run can't leave a
+    half-written file behind. The original file's permissions are kept.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile('w', dir=directory, prefix=f".{os.path.basename(path)}.",
+                                     suffix='.tmp', delete=False) as f:
+        tmp_path = f.name
+        try:
+            f.write(text)
+        except BaseException:
+            f.close()
+            os.unlink(tmp_path)
+            raise
+    try:
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def load_json_cache(path):
+    """Load a JSON object saved by a previous run, or {} if there's no usable one."""
+    try:
+        with open(path, 'r') as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return entries if isinstance(entries, dict) else {}
+
+def save_json_cache(path, entries, merge=True):
+    """
+    Save a JSON object for the next run. With merge, entries already saved
+    (e.g. by runs for other configs) are kept unless entries replaces them.
+    A cache is optional, so failures are only logged.
+    """
+    if merge:
+        entries = {**load_json_cache(path), **entries}
+    try:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        write_text_atomic(path, json.dumps(entries))
+    except (OSError, TypeError, ValueError) as e:
+        logger.debug("Could not save %s: %s", path, e)
+
+# The checksums identify files, they don't protect anything
+sha256_hasher = functools.partial(hashlib.sha256, usedforsecurity=False)
+
+# Read size used when hashing; large reads keep the time spent in OpenSSL
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def fadvise(fd, advice):
+    """Pass a page cache hint (e.g. 'POSIX_FADV_SEQUENTIAL') to the kernel where supported."""
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(fd, 0, 0, getattr(os, advice))
+        except OSError:
+            pass
+
+def size_and_sha256(file_path):
+    """Get the size and SHA256 of a file, opening it only once."""
+    with open(file_path, "rb", buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        fadvise(f.fileno(), 'POSIX_FADV_SEQUENTIAL')
+        try:
+            return size, _sha256_of_open_file(f)
+        finally:
+            # The ISO won't be read again, so don't let it push other data out of the cache
+            fadvise(f.fileno(), 'POSIX_FADV_DONTNEED')
+
+def _sha256_of_open_file(f):
+    """Hash an open, unbuffered binary file from its start."""
+    # Hash the mapped page cache in place, without copying it into Python
+    try:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            sha256_hash = sha256_hasher()
+            with memoryview(mm) as view:
+                sha256_hash.update(view)
+            return sha256_hash.hexdigest()
+    except (ValueError, OSError):
+        # Empty files and special files can't be mapped
+        pass
+
+    # hashlib.file_digest (Python 3.11+) hashes without a Python-level loop
+    if hasattr(hashlib, 'file_digest'):
+        return hashlib.file_digest(f, sha256_hasher).hexdigest()
+
+    # Read into one reused buffer instead of allocating a new bytes per chunk
+    sha256_hash = sha256_hasher()
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    while n := f.readinto(view):
+        sha256_hash.update(view[:n])
+    return sha256_hash.hexdigest()
+
+def parse_yaml_file(path):
+    """
+    Parse a YAML file, using a JSON sidecar from a previous run when the
+    file content hasn't changed since. JSON loads much faster than YAML.
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+
+    # Keyed by path, so an edited file replaces its sidecar instead of leaving the old one behind
+    path_key = hashlib.blake2b(os.fsencode(os.path.abspath(path)), digest_size=16).hexdigest()
+    sidecar = YAML_SIDECAR_DIR / f"{path_key}.json"
+    content_hash = hashlib.blake2b(raw, digest_size=16).hexdigest()
+    try:
+        with open(sidecar, 'r') as f:
+            cached = json.load(f)
+        if cached.get('hash') == content_hash:
+            return cached['data']
+    except (OSError, ValueError, AttributeError, KeyError):
+        pass
+
+    # Imported here so scripts that only use the other helpers (validate_json) don't need PyYAML
+    import yaml
+    # Prefer the LibYAML-backed loader, which is much faster than the pure-Python one
+    try:
+        from yaml import CSafeLoader as SafeLoader
+    except ImportError:
+        from yaml import SafeLoader
+
+    data = yaml.load(raw, Loader=SafeLoader)
+
+    # Only write a sidecar if JSON round-trips the data exactly
+    # (YAML allows non-string keys and dates, JSON does not)
+    try:
+        if json.loads(json.dumps(data)) == data:
+            YAML_SIDECAR_DIR.mkdir(parents=True, exist_ok=True)
+            write_text_atomic(sidecar, json.dumps({'hash': content_hash, 'data': data}))
+    except (OSError, TypeError, ValueError) as e:
+        logger.debug("Not caching %s as JSON: %s", path, e)
+
+    return data
+
+# A 'sha256:' or 'size:' line: indent and key, the value, then any trailing comment
+ISO_FIELD_LINE = re.compile(r"""^([ \t]*(sha256|size):[ \t]*)('[^'\n]*'|"[^"\n]*"|[^\s#'"]*)(.*)$""")
+
+# Hex digests YAML would read as a number if left unquoted
+NUMERIC_SCALAR = re.compile(r'[0-9]+([eE][0-9]+)?')
+
+def sha256_scalar(old, sha256):
+    """Format sha256 quoted the way the line's old value was."""
+    if old[:1] in ('"', "'"):
+        return f"{old[0]}{sha256}{old[0]}"
+    if old and sha256 and not NUMERIC_SCALAR.fullmatch(sha256):
+        return sha256
+    return f"'{sha256}'"
+
+def patch_iso_fields(text, updates):
+    """
+    Rewrite only the sha256 and size lines of the updated ISOs, leaving the
+    rest of the file byte-for-byte alone, which is much cheaper than having
+    ruamel serialize the whole file again. sha256 keeps the quoting it had.
+
+    Args:
+        text: Content of the version YAML file
+        updates: List of (iso_info, sha256, size), iso_info being the loaded
+            ruamel mapping, which knows the line each key is on
+
+    Returns the patched text, or None if a field couldn't be located.
+    """
+    lines = text.split('\n')
+    for iso_info, sha256, size in updates:
+        for key in ('sha256', 'size'):
+            try:
+                line_no = iso_info.lc.key(key)[0]
+                match = ISO_FIELD_LINE.match(lines[line_no])
+            except (AttributeError, KeyError, IndexError):
+                return None
+            if not match or match.group(2) != key:
+                return None
+            value = sha256_scalar(match.group(3), sha256) if key == 'sha256' else str(size)
+            lines[line_no] = f"{match.group(1)}{value}{match.group(4)}"
+    return '\n'.join(lines)
+
+def load_yaml_cached(path):
+    """
+    Load a YAML file, reusing the parsed result while the file is unchanged.
+    Returns a deep copy so callers can't corrupt the cached data.
+    """
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _yaml_cache.get(path)
+    if cached is not None and cached[0] == key:
+        _yaml_cache.move_to_end(path)
+        return copy.deepcopy(cached[1])
+
+    data = parse_yaml_file(path)
+
+    _yaml_cache[path] = (key, data)
+    _yaml_cache.move_to_end(path)
+    if len(_yaml_cache) > YAML_CACHE_SIZE:
+        _yaml_cache.popitem(last=False)
+    return copy.deepcopy(data)
+
+# ISO URLs found available by previous runs, with the time they were seen.
+# Only positive results are kept, so newly published ISOs are never hidden.
+AVAILABILITY_CACHE_FILE = CACHE_DIR / 'availability.json'
+AVAILABILITY_CACHE_TTL = 24 * 60 * 60
+_availability_cache = {}
+_availability_lock = threading.Lock()
+
+def load_availability_cache():
+    """Load ISO availability results from previous runs that haven't expired."""
+    entries = load_json_cache(AVAILABILITY_CACHE_FILE)
+    now = time.time()
+    with _availability_lock:
+        for url, seen in entries.items():
+            if now - seen < AVAILABILITY_CACHE_TTL and seen > _availability_cache.get(url, 0):
+                _availability_cache[url] = seen
+
+def save_availability_cache():
+    """
+    Persist unexpired ISO availability results for the next run. Entries
+    saved meanwhile by other processes are merged in rather than dropped.
+    """
+    load_availability_cache()
+    now = time.time()
+    with _availability_lock:
+        entries = {url: seen for url, seen in _availability_cache.items()
+                   if now - seen < AVAILABILITY_CACHE_TTL}
+    # Already merged above; expired entries on disk must not come back
+    save_json_cache(AVAILABILITY_CACHE_FILE, entries, merge=False)
+
+def is_known_available(url):
+    """Check whether a previous run recently found this ISO URL available."""
+    with _availability_lock:
+        seen = _availability_cache.get(url)
+    return seen is not None and time.time() - seen < AVAILABILITY_CACHE_TTL
+
+def record_available(url):
+    """Remember that this ISO URL is available."""
+    with _availability_lock:
+        _availability_cache[url] = time.time()
+
+# Parsed SHA256SUMS files from previous runs with their validators, so an
+# unchanged file is confirmed with a 304 instead of being downloaded again
+SHA256SUMS_CACHE_FILE = CACHE_DIR / 'sha256sums.json'
+_sha256sums_cache = {}
+_sha256sums_lock = threading.Lock()
+
+def load_sha256sums_cache():
+    """Load SHA256SUMS files saved by previous runs."""
+    entries = load_json_cache(SHA256SUMS_CACHE_FILE)
+    with _sha256sums_lock:
+        _sha256sums_cache.update(entries)
+
+def save_sha256sums_cache():
+    """Persist fetched SHA256SUMS files for the next run, keeping those of other configs."""
+    with _sha256sums_lock:
+        if not _sha256sums_cache:
+            return
+        entries = dict(_sha256sums_cache)
+    save_json_cache(SHA256SUMS_CACHE_FILE, entries)
+
+@functools.lru_cache(maxsize=None)
+def _fetch_sha256sums_cached(session, sha256sums_url):
+    """
+    Fetch and parse a SHA256SUMS file. Transient failures raise, so
+    lru_cache only keeps definitive answers.
+    """
+    with _sha256sums_lock:
+        cached = _sha256sums_cache.get(sha256sums_url)
+
+    # Revalidate a copy from a previous run instead of downloading it again
+    headers = {}
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    response = session.get(sha256sums_url, headers=headers, timeout=10)
+    if response.status_code == 304 and cached:
+        logger.info("SHA256SUMS unchanged since last run: %s", sha256sums_url)
+        return cached['checksums']
+    if response.status_code == 404:
+        logger.warning("No SHA256SUMS at %s", sha256sums_url)
+        return {}
+    response.raise_for_status()
+
+    # Lines are "<sha256> <file>" or "<sha256> *<file>"; skip blanks and comments
+    checksums = {
+        parts[1].lstrip('*'): {'sha256': parts[0]}
+        for line in response.text.splitlines()
+        if not line.startswith('#') and len(parts := line.split()) >= 2
+    }
+
+    logger.info("Fetched %s checksums from %s", len(checksums), sha256sums_url)
+
+    if response.headers.get('ETag') or response.headers.get('Last-Modified'):
+        with _sha256sums_lock:
+            _sha256sums_cache[sha256sums_url] = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'checksums': checksums,
+            }
+    return checksums
+
+def fetch_sha256sums_file(session, base_url):
+    """
+    Fetch and parse SHA256SUMS file from Ubuntu CDN.
+    Cached per base URL, so callers must not modify the returned dict.
+
+    Returns dict: {filename: {'sha256': ...}}, empty if it couldn't be fetched
+    """
+    import requests
+
+    sha256sums_url = f"{base_url.rstrip('/')}/SHA256SUMS"
+    try:
+        return _fetch_sha256sums_cached(session, sha256sums_url)
+    except requests.exceptions.RequestException as e:
+        logger.warning("Could not fetch SHA256SUMS from %s: %s", sha256sums_url, e)
+        return {}
+
+@functools.lru_cache(maxsize=None)
+def _get_file_size_cached(session, url):
+    """
+    Read the file size from the response headers. Transient failures raise,
+    so lru_cache only keeps definitive answers.
+    """
+    response = session.head(url, allow_redirects=True, timeout=10)
+    if response.status_code in (403, 405):
+        # Some mirrors refuse HEAD; a streamed GET returns the headers
+        # without the body being downloaded
+        with session.get(url, stream=True, allow_redirects=True, timeout=10) as response:
+            pass
+    if response.status_code >= 500:
+        response.raise_for_status()
+    if response.status_code == 200:
+        size = response.headers.get('content-length')
+        return int(size) if size else 0
+    return 0
+
+def get_file_size(session, url):
+    """Get file size using HEAD request."""
+    try:
+        return _get_file_size_cached(session, url)
+    except Exception as e:
+        logger.debug("Could not get size for %s: %s", url, e)
+    return 0
+
+def lookup_iso(session, base_url, iso_filename, current_sha256='', current_size=0):
+    """
+    Look up an ISO's published checksum and its size, using the caller's session.
+    Returns (checksums, size); size is None if the ISO isn't in SHA256SUMS.
+    """
+    checksums = fetch_sha256sums_file(session, base_url)
+    if iso_filename not in checksums:
+        return checksums, None
+
+    # An unchanged checksum means an unchanged file, so the known size still holds
+    if current_size and checksums[iso_filename]['sha256'] == current_sha256:
+        return checksums, current_size
+
+    # Get file size via HEAD request
+    return checksums, get_file_size(session, f"{base_url}/{iso_filename}")
+
+# '{{ name }}' placeholders in path templates
+PLACEHOLDER_PATTERN = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+class _KeepMissingPlaceholders(dict):
+    """format_map() mapping that leaves unknown placeholders in place."""
+    def __missing__(self, key):
+        return f'{{{{ {key} }}}}'
+
+@functools.lru_cache(maxsize=256)
+def compile_path_template(template):
+    """
+    Convert a '{{ name }}' path template to a str.format() string, once per
+    template, so rendering it is a single pass instead of chained replaces.
+    """
+    parts = []
+    pos = 0
+    for match in PLACEHOLDER_PATTERN.finditer(template):
+        parts.append(template[pos:match.start()].replace('{', '{{').replace('}', '}}'))
+        parts.append(f'{{{match.group(1)}}}')
+        pos = match.end()
+    parts.append(template[pos:].replace('{', '{{').replace('}', '}}'))
+    return ''.join(parts)
+
+def render_path_template(template, **values):
+    """Fill in a path template's placeholders; unknown ones are left as they are."""
+    return compile_path_template(template).format_map(_KeepMissingPlaceholders(values))
+
+def version_key(version):
+    """Convert version string to a tuple of ints for comparison (24.04.2 -> (24, 4, 2))."""
+    return tuple(int(part) for part in version.split('.'))
+
+def load_release_codenames(path=RELEASE_CODENAMES_FILE):
+    """Load the release codenames mapping."""
+    return load_yaml_cached(path)['release_codenames']
+
+def get_release_info(version, codenames):
+    """Get release name and codename for a version."""
+    base_version = '.'.join(version.split('.')[:2])  # Convert 24.04.2 to 24.04
+    version_info = codenames.get(base_version, {})
+    return {
+        'release': version_info.get('release', ''),
+        'codename': version_info.get('codename', '')
+    }
+
+def has_valid_data(spin):
+    """Check whether a spin entry already has a SHA256 and size filled in."""
+    iso_info = spin.get('files', {}).get('iso', {})
+    return bool(iso_info.get('sha256')) and iso_info.get('size', 0) > 0
@@ -9,105 +9,184 @@ This script:
 4. Automatically generates version template files
 """
 
-import requests
-from bs4 import BeautifulSoup
 import logging
 import re
-import yaml
 import argparse
+import functools
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from urllib.parse import urljoin
-from ruamel.yaml import YAML
+import yaml
+
+import _ubuntu_common
+from _ubuntu_common import (
+    MAX_WORKERS,
+    create_session,
+    get_release_info,
+    has_valid_data,
+    is_known_available,
+    load_availability_cache,
+    load_yaml_cached,
+    record_available,
+    save_availability_cache,
+    version_key,
+)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # Minimum supported version (YY.MM format)
 MIN_VERSION = "22.04"
+MIN_VERSION_KEY = version_key(MIN_VERSION)
 
-def version_to_float(version):
-    """Convert version string to float for comparison."""
-    try:
-        parts = version.split('.')
-        return float(parts[0]) + float(parts[1]) / 100
-    except (ValueError, IndexError):
-        return 0
+# Maximum number of versions probed at the same time
+MAX_VERSION_WORKERS = 4
 
-def get_existing_versions():
-    """Get list of versions we already have configured."""
-    versions_dir = Path('config/versions')
-    if not versions_dir.exists():
-        return set()
+# Shared by all requests so the availability checks reuse connections. Up
+# to MAX_VERSION_WORKERS versions each run MAX_WORKERS checks at once.
+SESSION = create_session(MAX_VERSION_WORKERS * MAX_WORKERS)
 
-    existing = set()
-    for yaml_file in versions_dir.glob('*.yaml'):
-        version = yaml_file.stem  # filename without extension
-        existing.add(version)
+# Links in the CDN's Apache directory listings
+HREF_PATTERN = re.compile(rb'href="([^"]+)"')
 
-    logger.info(f"Found {len(existing)} existing version configs: {sorted(existing)}")
-    return existing
+# Pattern to match version directory links (e.g., 24.04, 24.04.2, 25.04)
+VERSION_HREF_PATTERN = re.compile(rb'href="(\d{2}\.\d{2}(?:\.\d+)?)/?"')
 
-def scrape_ubuntu_versions():
+def iter_hrefs(response, pattern=HREF_PATTERN, chunk_size=65536):
     """
-    Scrape available Ubuntu versions from multiple sources.
-    Returns a set of version strings.
+    Yield the link targets matched by pattern in a streamed HTML response
+    without decoding the whole page. Anything after the last match that
+    could still start a tag is carried over, so links split across chunks
+    are still found.
     """
-    versions = set()
-    min_version_float = version_to_float(MIN_VERSION)
+    buffer = b''
+    for chunk in response.iter_content(chunk_size):
+        buffer += chunk
+        end = 0
+        for match in pattern.finditer(buffer):
+            yield match.group(1).decode('ascii', 'ignore')
+            end = match.end()
+        tag_start = buffer.rfind(b'<', end)
+        buffer = buffer[tag_start:] if tag_start != -1 else b''
+
+def get_existing_versions():
+    """Get list of versions we already have configured."""
+    try:
+        with os.scandir('config/versions') as entries:
+            # filename without extension; d_type usually spares a stat() per entry
+            existing = {
+                entry.name[:-len('.yaml')]
+                for entry in entries
+                if entry.name.endswith('.yaml') and entry.is_file()
+            }
+    except FileNotFoundError:
+        return set()
 
-    # Pattern to match version numbers (e.g., 24.04, 24.04.2, 25.04)
-    version_pattern = re.compile(r'^(\d{2}\.\d{2}(?:\.\d+)?)/?$')
+    logger.info(f"Found {len(existing)} existing version configs: {sorted(existing)}")
+    return existing
 
-    sources = [
-        'https://cdimage.ubuntu.com/releases/',
-        'https://cdimage.ubuntu.com/kubuntu/releases/',
-        'https://cdimage.ubuntu.com/xubuntu/releases/',
-    ]
+# CDN index pages that list release versions
+VERSION_SOURCES = [
+    'https://cdimage.ubuntu.com/releases/',
+    'https://cdimage.ubuntu.com/kubuntu/releases/',
+    'https://cdimage.ubuntu.com/xubuntu/releases/',
+]
 
-    for source_url in sources:
-        try:
-            logger.debug(f"Checking {source_url}")
-            response = requests.get(source_url, timeout=10)
+def scrape_versions_from(source_url):
+    """Scrape the supported versions listed on one CDN index page."""
+    versions = set()
+    try:
+        logger.debug(f"Checking {source_url}")
+        with SESSION.get(source_url, timeout=15, stream=True) as response:
             response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
 
-            for link in soup.find_all('a'):
-                href = link.get('href', '')
-                match = version_pattern.match(href)
-                if match:
-                    version = match.group(1)
-                    if version_to_float(version) >= min_version_float:
-                        versions.add(version)
+            for version in iter_hrefs(response, VERSION_HREF_PATTERN):
+                if version_key(version) >= MIN_VERSION_KEY:
+                    versions.add(version)
 
-        except Exception as e:
-            logger.warning(f"Error scraping {source_url}: {e}")
+    except Exception as e:
+        logger.warning(f"Error scraping {source_url}: {e}")
 
     return versions
 
+def scrape_ubuntu_versions():
+    """
+    Scrape available Ubuntu versions from multiple sources.
+    Returns a set of version strings.
+    """
+    # The index pages are independent, so fetch them all at once
+    with ThreadPoolExecutor(max_workers=len(VERSION_SOURCES)) as executor:
+        return set().union(*executor.map(scrape_versions_from, VERSION_SOURCES))
+
+@functools.lru_cache(maxsize=4096)
+def _check_iso_exists_cached(url):
+    """
+    HEAD the URL and report whether it exists. Transient failures (network
+    errors, 5xx responses) raise instead, so lru_cache only keeps definitive answers.
+    """
+    response = SESSION.head(url, allow_redirects=True, timeout=10)
+    if response.status_code >= 500:
+        response.raise_for_status()
+    return response.status_code == 200
+
 def check_iso_exists(url):
     """Check if an ISO file exists at the given URL using HEAD request."""
     try:
-        response = requests.head(url, allow_redirects=True, timeout=10)
-        return response.status_code == 200
+        return _check_iso_exists_cached(url)
     except Exception as e:
         logger.debug(f"Error checking {url}: {e}")
         return False
 
-def verify_spin_availability(version, spin_id, spin_config, release, release_codename):
+@functools.lru_cache(maxsize=256)
+def _list_release_files_cached(release_url):
+    """
+    Fetch a release directory listing and return the set of file names in it.
+    Transient failures raise, so lru_cache only keeps definitive answers.
+    """
+    with SESSION.get(release_url, timeout=15, stream=True) as response:
+        if response.status_code == 404:
+            return frozenset()
+        response.raise_for_status()
+        return frozenset(iter_hrefs(response))
+
+def list_release_files(release_url):
+    """
+    List the files in a release directory with a single GET.
+    Returns None if the listing couldn't be fetched.
+    """
+    try:
+        return _list_release_files_cached(release_url)
+    except Exception as e:
+        logger.debug(f"Error listing {release_url}: {e}")
+        return None
+
+def build_spin_templates(spins_config):
+    """
+    Precompute the version-independent parts of each spin's template,
+    so only the version-dependent fields are filled in per version.
+    """
+    return {
+        spin_id: {
+            'url_base': spin_config['url_base'].rstrip('/'),
+            # Extract filename from template
+            'filename': spin_config['path_template'].split('/')[-1].strip('"'),
+            'path_template': spin_config['path_template'],
+            'name': spin_config['name'],
+            'content_id': spin_config['content_id'],
+        }
+        for spin_id, spin_config in spins_config.items()
+    }
+
+def verify_spin_availability(version, spin_id, spin_template):
     """
     Verify that a specific spin ISO is available for download.
     Returns the ISO URL if available, None otherwise.
     """
-    # Build the ISO URL based on the spin configuration
-    url_base = spin_config['url_base'].rstrip('/')
-    
-    # Extract filename from template
-    filename = spin_config['path_template'].split('/')[-1] \
-        .replace('{{ version }}', version) \
-        .strip('"')
-    
+    url_base = spin_template['url_base']
+    filename = spin_template['filename'].replace('{{ version }}', version)
+
     # Construct full ISO URL
     # For most spins: https://cdimage.ubuntu.com/kubuntu/releases/24.04/release/kubuntu-24.04-desktop-amd64.iso
     full_url = f"{url_base}/{version}/release/{filename}"
@@ -115,8 +194,20 @@ def verify_spin_availability(version, spin_id, spin_config, release, release_cod
     # Fix up URL to ensure proper formatting
     full_url = full_url.replace('//', '/').replace('http:/', 'http://').replace('https:/', 'https://')
 
-    # Check if ISO exists
-    if check_iso_exists(full_url):
+    # Check if ISO exists, preferring the directory listing over a HEAD per ISO
+    if is_known_available(full_url):
+        exists = True
+    else:
+        release_url, _, _ = full_url.rpartition('/')
+        release_files = list_release_files(f"{release_url}/")
+        if release_files is not None:
+            exists = filename in release_files
+        else:
+            exists = check_iso_exists(full_url)
+        if exists:
+            record_available(full_url)
+
+    if exists:
         logger.info(f"✓ Found: {spin_id} {version} at {full_url}")
         return full_url
     else:
@@ -126,8 +217,7 @@ def verify_spin_availability(version, spin_id, spin_config, release, release_cod
 def load_spins_config():
     """Load spins configuration."""
     try:
-        with open('config/spins.yaml', 'r') as f:
-            return yaml.safe_load(f)['spins']
+        return load_yaml_cached('config/spins.yaml')['spins']
     except Exception as e:
         logger.error(f"Failed to load spins config: {e}")
         sys.exit(1)
@@ -135,25 +225,13 @@ def load_spins_config():
 def load_release_codenames():
     """Load release codenames configuration."""
     try:
-        with open('config/release_codenames.yaml', 'r') as f:
-            return yaml.safe_load(f)['release_codenames']
+        return _ubuntu_common.load_release_codenames()
     except Exception as e:
         logger.error(f"Failed to load release codenames: {e}")
         sys.exit(1)
 
-def get_release_info(version, codenames):
-    """Get release name and codename for a version."""
-    base_version = '.'.join(version.split('.')[:2])  # Convert 24.04.2 to 24.04
-    version_info = codenames.get(base_version, {})
-    return {
-        'release': version_info.get('release', ''),
-        'codename': version_info.get('codename', '')
-    }
-
-def create_spin_entry(spin_id, spin_config, version, release, release_codename):
+def create_spin_entry(spin_id, spin_template, version, release, release_codename):
     """Create a spin entry for the version template."""
-    url_base = spin_config['url_base'].rstrip('/')
-
     return {
         'name': spin_id,
         'release': release,
@@ -164,19 +242,29 @@ def create_spin_entry(spin_id, spin_config, version, release, release_codename):
         'architectures': ['amd64'],
         'files': {
             'iso': {
-                'path_template': spin_config['path_template'],
-                'url': f"{url_base}/{version}/release/",
+                'path_template': spin_template['path_template'],
+                'url': f"{spin_template['url_base']}/{version}/release/",
                 'sha256': '',
                 'size': 0
             }
         }
     }
 
-def generate_version_template(version, spins_config, codenames):
+def generate_version_template(version, spins_config=None, codenames=None, spin_templates=None):
     """
     Generate a complete version template with all available spins.
     Only includes spins where ISOs are actually available.
+
+    The configs are loaded if not given; callers generating several
+    versions should load them once and pass them in.
     """
+    if spins_config is None:
+        spins_config = load_spins_config()
+    if codenames is None:
+        codenames = load_release_codenames()
+    if spin_templates is None:
+        spin_templates = build_spin_templates(spins_config)
+
     release_info = get_release_info(version, codenames)
     release = release_info['release']
     release_codename = release_info['codename']
@@ -195,17 +283,24 @@ def generate_version_template(version, spins_config, codenames):
         'spin_groups': {}
     }
 
-    # Check each spin for availability
+    # Check all spins for availability concurrently; the checks are network-bound
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(verify_spin_availability, version, spin_id, spin_template): spin_id
+            for spin_id, spin_template in spin_templates.items()
+        }
+        iso_urls = {futures[future]: future.result() for future in as_completed(futures)}
+
+    # Build the template in spins.yaml order so output stays deterministic
     available_spins = []
-    for spin_id, spin_config in spins_config.items():
-        iso_url = verify_spin_availability(version, spin_id, spin_config, release, release_codename)
-        if iso_url:
+    for spin_id, spin_template in spin_templates.items():
+        if iso_urls[spin_id]:
             available_spins.append(spin_id)
-            spin_entry = create_spin_entry(spin_id, spin_config, version, release, release_codename)
+            spin_entry = create_spin_entry(spin_id, spin_template, version, release, release_codename)
 
             template['spin_groups'][spin_id] = {
-                'name': spin_config['name'],
-                'content_id': spin_config['content_id'],
+                'name': spin_template['name'],
+                'content_id': spin_template['content_id'],
                 'spins': [spin_entry]
             }
 
@@ -216,30 +311,66 @@ def generate_version_template(version, spins_config, codenames):
     logger.info(f"Version {version} has {len(available_spins)} available spins: {', '.join(available_spins)}")
     return template
 
+class TemplateDumper(yaml.SafeDumper):
+    """
+    SafeDumper that indents sequences under their key, matching the style
+    of the configs written with ruamel.yaml by the other scripts.
+    """
+    def increase_indent(self, flow=False, indentless=False):
+        return super().increase_indent(flow, False)
+
 def save_version_template(version, template):
     """Save version template to YAML file."""
     output_dir = Path('config/versions')
     output_dir.mkdir(parents=True, exist_ok=True)
     output_file = output_dir / f'{version}.yaml'
 
-    yaml_handler = YAML()
-    yaml_handler.preserve_quotes = True
-    yaml_handler.indent(mapping=2, sequence=4, offset=2)
-    yaml_handler.default_flow_style = False
+    # Serialize once and only touch the file if the content actually changed
+    new_content = yaml.dump(template, Dumper=TemplateDumper, default_flow_style=False,
+                            sort_keys=False, allow_unicode=True).encode('utf-8')
+
+    try:
+        old_content = output_file.read_bytes()
+    except FileNotFoundError:
+        old_content = None
 
-    with open(output_file, 'w') as f:
-        yaml_handler.dump(template, f)
+    if new_content == old_content:
+        logger.info(f"Version template unchanged: {output_file}")
+        return output_file
 
+    output_file.write_bytes(new_content)
     logger.info(f"Created version template: {output_file}")
     return output_file
 
-def check_for_new_versions(dry_run=False, check_specific_version=None):
+def is_version_complete(version):
+    """
+    Check whether a version config already exists with checksums for every spin.
+    Complete configs don't need their ISOs probed or their template regenerated.
+    """
+    version_file = os.path.join('config/versions', f'{version}.yaml')
+    try:
+        config = load_yaml_cached(version_file)
+        spin_groups = config['spin_groups']
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        logger.debug(f"Could not read {version_file}: {e}")
+        return False
+
+    return bool(spin_groups) and all(
+        has_valid_data(spin)
+        for group in spin_groups.values()
+        for spin in group.get('spins', [])
+    )
+
+def check_for_new_versions(dry_run=False, check_specific_version=None, use_cache=True):
     """
     Main function to check for new versions and generate templates.
 
     Args:
         dry_run: If True, only report what would be done without creating files
         check_specific_version: If provided, only check this specific version
+        use_cache: If False, ignore ISO availability results from previous runs
     """
     spins_config = load_spins_config()
     codenames = load_release_codenames()
@@ -258,22 +389,52 @@ def check_for_new_versions(dry_run=False, check_specific_version=None):
             logger.error("No versions found. Check your internet connection.")
             return False
 
-        logger.info(f"Found {len(all_versions)} available versions: {sorted(all_versions)}")
+        logger.info(f"Found {len(all_versions)} available versions: {sorted(all_versions, key=version_key)}")
         versions_to_check = all_versions - existing_versions
 
     if not versions_to_check:
         logger.info("No new versions to process. All versions are up to date!")
         return True
 
-    logger.info(f"New versions to process: {sorted(versions_to_check)}")
+    # Sort numerically (24.04.10 after 24.04.9) and only once; a version
+    # given on the command line is used as is
+    if check_specific_version:
+        ordered_versions = [check_specific_version]
+    else:
+        ordered_versions = sorted(versions_to_check, key=version_key)
+    logger.info(f"New versions to process: {ordered_versions}")
+
+    # Only versions seen in the config directory scan can have a file to check
+    pending_versions = []
+    for version in ordered_versions:
+        if version in existing_versions and is_version_complete(version):
+            logger.info(f"Version {version} already has checksums for all spins, skipping")
+        else:
+            pending_versions.append(version)
+
+    # Probe all pending versions at once so their checks share the session's
+    # connections instead of waiting for the previous version to finish
+    templates = {}
+    if pending_versions:
+        if use_cache:
+            load_availability_cache()
+        spin_templates = build_spin_templates(spins_config)
+        with ThreadPoolExecutor(max_workers=min(len(pending_versions), MAX_VERSION_WORKERS)) as executor:
+            futures = {
+                executor.submit(generate_version_template, version, spins_config, codenames,
+                                spin_templates): version
+                for version in pending_versions
+            }
+            templates = {futures[future]: future.result() for future in as_completed(futures)}
+        save_availability_cache()
 
     created_files = []
-    for version in sorted(versions_to_check):
+    for version in pending_versions:
         logger.info(f"\n{'='*60}")
         logger.info(f"Processing version: {version}")
         logger.info(f"{'='*60}")
 
-        template = generate_version_template(version, spins_config, codenames)
+        template = templates[version]
 
         if template:
             if dry_run:
@@ -312,11 +473,16 @@ Examples:
 
   # Verbose output
   %(prog)s -v
+
+  # Re-check ISO availability instead of trusting results from the last 24h
+  %(prog)s --no-cache
         """
     )
     parser.add_argument('--version', help='Check specific version only (e.g., 24.04.2)')
     parser.add_argument('--dry-run', action='store_true',
                        help='Show what would be done without making changes')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Ignore cached ISO availability results from previous runs')
     parser.add_argument('-v', '--verbose', action='store_true',
                        help='Enable verbose output')
 
@@ -328,7 +494,8 @@ Examples:
     try:
         success = check_for_new_versions(
             dry_run=args.dry_run,
-            check_specific_version=args.version
+            check_specific_version=args.version,
+            use_cache=not args.no_cache
         )
         sys.exit(0 if success else 1)
     except Exception as e:
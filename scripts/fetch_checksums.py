@@ -6,81 +6,65 @@ This is much faster than downloading entire ISOs (4-6GB each).
 Ubuntu publishes SHA256SUMS files alongside their ISOs.
 """
 
-import requests
 import logging
 import argparse
+import io
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from ruamel.yaml import YAML
 
+import _ubuntu_common
+from _ubuntu_common import (create_session, load_sha256sums_cache, lookup_iso, patch_iso_fields,
+                            render_path_template, save_sha256sums_cache, size_and_sha256, write_text_atomic)
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def fetch_sha256sums_file(base_url):
-    """
-    Fetch and parse SHA256SUMS file from Ubuntu CDN.
+# Maximum number of spins looked up at the same time
+MAX_WORKERS = 8
 
-    Returns dict: {filename: {'sha256': ..., 'size': ...}}
-    """
-    sha256sums_url = f"{base_url.rstrip('/')}/SHA256SUMS"
+# Shared by all requests so connections to the CDN are kept alive
+SESSION = create_session(MAX_WORKERS)
 
+def verify_local_iso(verify_dir, iso_filename):
+    """
+    Hash a local copy of an ISO if there is one.
+    Returns its SHA256, or None if there's no readable copy.
+    """
+    local_path = Path(verify_dir, iso_filename)
+    if not local_path.is_file():
+        return None
     try:
-        response = requests.get(sha256sums_url, timeout=10)
-        response.raise_for_status()
+        return size_and_sha256(local_path)[1]
+    except OSError as e:
+        logger.warning("Could not read %s: %s", local_path, e)
+        return None
 
-        checksums = {}
-        for line in response.text.strip().split('\n'):
-            if not line.strip() or line.startswith('#'):
-                continue
-
-            parts = line.split()
-            if len(parts) >= 2:
-                sha256 = parts[0]
-                # Handle both "file" and "*file" formats
-                filename = parts[1].lstrip('*')
-                checksums[filename] = {'sha256': sha256}
-
-        logger.info(f"Fetched {len(checksums)} checksums from {sha256sums_url}")
-        return checksums
-
-    except requests.exceptions.RequestException as e:
-        logger.warning(f"Could not fetch SHA256SUMS from {sha256sums_url}: {e}")
-        return {}
-
-def get_file_size(url):
-    """Get file size using HEAD request."""
-    try:
-        response = requests.head(url, allow_redirects=True, timeout=10)
-        if response.status_code == 200:
-            size = response.headers.get('content-length')
-            return int(size) if size else 0
-    except Exception as e:
-        logger.debug(f"Could not get size for {url}: {e}")
-    return 0
-
-def update_version_checksums(config_file, dry_run=False):
+def update_version_checksums(config_file, dry_run=False, verify_dir=None):
     """
     Update checksums in a version YAML file by fetching SHA256SUMS.
 
     Args:
         config_file: Path to version YAML file
         dry_run: If True, only show what would be updated
+        verify_dir: Directory with local ISOs to check against SHA256SUMS;
+            spins whose local ISO doesn't match are not updated
     """
     yaml = YAML()
     yaml.preserve_quotes = True
     yaml.indent(mapping=2, sequence=4, offset=2)
 
     with open(config_file, 'r') as f:
-        data = yaml.load(f)
+        text = f.read()
+    data = yaml.load(text)
 
     version = data.get('version')
-    logger.info(f"Processing version {version} from {config_file}")
-
-    updated_count = 0
+    logger.info("Processing version %s from %s", version, config_file)
 
+    jobs = []
     for group_name, group in data.get('spin_groups', {}).items():
         for spin in group.get('spins', []):
-            spin_name = spin.get('name')
             iso_info = spin.get('files', {}).get('iso', {})
 
             if not iso_info:
@@ -91,49 +75,81 @@ def update_version_checksums(config_file, dry_run=False):
 
             # Construct the expected ISO filename
             release = spin.get('release', '')
-            iso_filename = path_template \
-                .replace('{{ release }}', release) \
-                .replace('{{ version }}', version) \
+            iso_filename = render_path_template(path_template, release=release, version=version) \
                 .split('/')[-1]  # Get just the filename
 
-            # Fetch SHA256SUMS file
-            checksums = fetch_sha256sums_file(base_url)
-
-            if iso_filename in checksums:
-                new_sha256 = checksums[iso_filename]['sha256']
-
-                # Get file size via HEAD request
-                iso_url = f"{base_url}/{iso_filename}"
-                new_size = get_file_size(iso_url)
-
-                current_sha256 = iso_info.get('sha256', '')
-                current_size = iso_info.get('size', 0)
-
-                if current_sha256 != new_sha256 or current_size != new_size:
-                    logger.info(f"✓ {spin_name}: {iso_filename}")
-                    logger.info(f"  SHA256: {new_sha256}")
-                    logger.info(f"  Size: {new_size:,} bytes ({new_size / (1024**3):.2f} GB)")
-
-                    if not dry_run:
-                        iso_info['sha256'] = new_sha256
-                        iso_info['size'] = new_size
-                        updated_count += 1
-                    else:
-                        logger.info(f"  [DRY RUN] Would update")
+            jobs.append((spin.get('name'), iso_info, base_url, iso_filename))
+
+    def process(job):
+        spin_name, iso_info, base_url, iso_filename = job
+        checksums, size = lookup_iso(SESSION, base_url, iso_filename, iso_info.get('sha256', ''), iso_info.get('size', 0))
+        local_sha256 = None
+        if verify_dir and size is not None:
+            local_sha256 = verify_local_iso(verify_dir, iso_filename)
+        return checksums, size, local_sha256
+
+    # The lookups are network-bound and hashing releases the GIL, so run them concurrently
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        results = list(executor.map(process, jobs))
+
+    # Apply the results in config order, on this thread only
+    updates = []
+    mismatches = 0
+    for (spin_name, iso_info, base_url, iso_filename), (checksums, new_size, local_sha256) in zip(jobs, results):
+        if new_size is not None:
+            new_sha256 = checksums[iso_filename]['sha256']
+
+            if local_sha256 is not None:
+                if local_sha256 != new_sha256:
+                    logger.error("✗ %s: local %s doesn't match SHA256SUMS", spin_name, iso_filename)
+                    logger.error("  Local:      %s", local_sha256)
+                    logger.error("  SHA256SUMS: %s", new_sha256)
+                    mismatches += 1
+                    continue
+                logger.info("✓ %s: local %s matches SHA256SUMS", spin_name, iso_filename)
+
+            current_sha256 = iso_info.get('sha256', '')
+            current_size = iso_info.get('size', 0)
+
+            if current_sha256 != new_sha256 or current_size != new_size:
+                logger.info("✓ %s: %s", spin_name, iso_filename)
+                logger.info("  SHA256: %s", new_sha256)
+                logger.info("  Size: %s bytes (%.2f GB)", new_size, new_size / (1024**3))
+
+                if not dry_run:
+                    updates.append((iso_info, new_sha256, new_size))
                 else:
-                    logger.info(f"✓ {spin_name}: Already up to date")
+                    logger.info("  [DRY RUN] Would update")
             else:
-                logger.warning(f"✗ {spin_name}: {iso_filename} not found in SHA256SUMS")
-                logger.debug(f"  Available files: {list(checksums.keys())}")
+                logger.info("✓ %s: Already up to date", spin_name)
+        else:
+            logger.warning("✗ %s: %s not found in SHA256SUMS", spin_name, iso_filename)
+            logger.debug("  Available files: %s", list(checksums))
 
+    updated_count = len(updates)
     if updated_count > 0 and not dry_run:
-        with open(config_file, 'w') as f:
-            yaml.dump(data, f)
-        logger.info(f"\n✅ Updated {updated_count} checksums in {config_file}")
+        patched = patch_iso_fields(text, updates)
+        if patched is not None:
+            if patched != text:
+                write_text_atomic(config_file, patched)
+        else:
+            # The file doesn't look as expected, so let ruamel rewrite all of it
+            logger.debug("Could not patch %s in place, rewriting it", config_file)
+            for iso_info, new_sha256, new_size in updates:
+                iso_info['sha256'] = new_sha256
+                iso_info['size'] = new_size
+            # ruamel emits many tiny writes, so collect them and write the file once
+            buffer = io.StringIO()
+            yaml.dump(data, buffer)
+            write_text_atomic(config_file, buffer.getvalue())
+        logger.info("\n✅ Updated %s checksums in %s", updated_count, config_file)
     elif dry_run:
-        logger.info(f"\n[DRY RUN] Would update {updated_count} checksums")
+        logger.info("\n[DRY RUN] Would update %s checksums", updated_count)
     else:
-        logger.info(f"\n✅ All checksums are up to date")
+        logger.info("\n✅ All checksums are up to date")
+
+    if mismatches:
+        raise ValueError(f"{mismatches} local ISO(s) don't match SHA256SUMS")
 
 def main():
     parser = argparse.ArgumentParser(
@@ -147,16 +163,24 @@ Examples:
   # Dry run to see what would be updated
   %(prog)s --config config/versions/24.04.3.yaml --dry-run
 
-  # Update all version files
-  for file in config/versions/*.yaml; do
-    %(prog)s --config "$file"
-  done
+  # Check already downloaded ISOs against SHA256SUMS while updating
+  %(prog)s --config config/versions/24.04.3.yaml --verify-local ~/Downloads
+
+  # Download every SHA256SUMS file again instead of revalidating cached copies
+  %(prog)s --config config/versions/24.04.3.yaml --force
+
+  # Update all version files in one run
+  %(prog)s --config config/versions/*.yaml
         """
     )
-    parser.add_argument('--config', required=True,
-                       help='Path to version YAML config file')
+    parser.add_argument('--config', required=True, nargs='+',
+                       help='Path(s) to version YAML config file(s)')
     parser.add_argument('--dry-run', action='store_true',
                        help='Show what would be done without making changes')
+    parser.add_argument('--verify-local', metavar='DIR',
+                       help='Check ISOs found in DIR against SHA256SUMS before updating')
+    parser.add_argument('--force', action='store_true',
+                       help='Ignore SHA256SUMS files cached by previous runs')
     parser.add_argument('-v', '--verbose', action='store_true',
                        help='Enable verbose output')
 
@@ -164,15 +188,31 @@ Examples:
 
     if args.verbose:
         logger.setLevel(logging.DEBUG)
+        _ubuntu_common.logger.setLevel(logging.DEBUG)
 
-    if not Path(args.config).exists():
-        logger.error(f"Config file not found: {args.config}")
-        sys.exit(1)
+    for config_file in args.config:
+        if not Path(config_file).exists():
+            logger.error("Config file not found: %s", config_file)
+            sys.exit(1)
+
+    if not args.force:
+        load_sha256sums_cache()
 
+    # All files share the session and the fetched SHA256SUMS, so versions
+    # published in the same directory only cost one request
+    failed = False
     try:
-        update_version_checksums(args.config, dry_run=args.dry_run)
-    except Exception as e:
-        logger.error(f"Fatal error: {e}", exc_info=args.verbose)
+        for config_file in args.config:
+            try:
+                update_version_checksums(config_file, dry_run=args.dry_run, verify_dir=args.verify_local)
+            except Exception as e:
+                logger.error("Failed to process %s: %s", config_file, e, exc_info=args.verbose)
+                failed = True
+    finally:
+        save_sha256sums_cache()
+        SESSION.close()
+
+    if failed:
         sys.exit(1)
 
 if __name__ == '__main__':
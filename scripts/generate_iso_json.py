@@ -1,21 +1,29 @@
 #!/usr/bin/env python3
 
-import yaml
 import json
 import os
 import argparse
-import glob
+import functools
 from collections import defaultdict
 import logging
 
+# orjson is optional; it serializes much faster than the json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+import _ubuntu_common
+from _ubuntu_common import has_valid_data, parse_yaml_file, render_path_template
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 def load_yaml_config(config_file):
     """Load and validate YAML config file"""
     try:
-        with open(config_file, 'r') as f:
-            config = yaml.safe_load(f)
+        # LibYAML-backed parse, reusing a JSON copy when the file is unchanged
+        config = parse_yaml_file(config_file)
         
         if not isinstance(config, dict):
             logger.error(f"Invalid YAML structure in {config_file}: not a dictionary")
@@ -34,19 +42,14 @@ def load_yaml_config(config_file):
         logger.error(f"Error loading {config_file}: {e}")
         return None
 
-def load_release_codenames():
-    """Load release codenames mapping"""
-    with open('config/release_codenames.yaml', 'r') as f:
-        return yaml.safe_load(f)['release_codenames']
-
+@functools.lru_cache(maxsize=None)
 def get_release_info(version):
-    """Get release and codename for a version"""
-    codenames = load_release_codenames()
-    base_version = '.'.join(version.split('.')[:2])  # Convert 24.04.2 to 24.04
-    version_info = codenames.get(base_version, {})
+    """Get release and codename for a version (cached, don't modify the result)"""
+    codenames = _ubuntu_common.load_release_codenames()
+    release_info = _ubuntu_common.get_release_info(version, codenames)
     return {
-        'release': version_info.get('release', ''),
-        'release_codename': version_info.get('codename', '')
+        'release': release_info['release'],
+        'release_codename': release_info['codename']
     }
 
 def aggregate_versions(versions_dir):
@@ -57,9 +60,14 @@ def aggregate_versions(versions_dir):
         "products": {}
     })
 
-    yaml_files = glob.glob(os.path.join(versions_dir, "*.yaml"))
+    # DirEntry.is_file() uses the type from the directory listing, no stat needed
+    with os.scandir(versions_dir) as entries:
+        # Hidden files are skipped, like glob("*.yaml") did
+        yaml_files = sorted(entry.path for entry in entries
+                            if entry.name.endswith(".yaml") and not entry.name.startswith(".")
+                            and entry.is_file())
     
-    for yaml_file in sorted(yaml_files):
+    for yaml_file in yaml_files:
         config = load_yaml_config(yaml_file)
         if config is None:
             logger.warning(f"Skipping invalid file: {yaml_file}")
@@ -71,8 +79,7 @@ def aggregate_versions(versions_dir):
             
             for spin in group_data["spins"]:
                 # Skip spins without valid SHA256 and size
-                if not spin.get("files", {}).get("iso", {}).get("sha256") or \
-                   not spin.get("files", {}).get("iso", {}).get("size", 0) > 0:
+                if not has_valid_data(spin):
                     continue
 
                 release_info = get_release_info(spin.get("version", ""))
@@ -86,55 +93,80 @@ def aggregate_versions(versions_dir):
                     "release_title": spin.get("release_title", spin.get("version", ""))
                 }
                 
+                content_id = aggregated_spins[group_name]["content_id"]
+                products = aggregated_spins[group_name]["products"]
+                key_prefix = f"{content_id}:{spin_data['image_type']}:{spin_data['version']}"
+
+                try:
+                    iso_info = spin["files"]["iso"]
+                    # Fill in everything but the architecture once per spin
+                    spin_path = render_path_template(
+                        iso_info["path_template"],
+                        release=spin_data["release"],
+                        name=spin["name"],
+                        version=spin_data["version"],
+                        image_type=spin_data["image_type"]
+                    )
+                except KeyError as e:
+                    print(f"Warning: Missing required field {e} in spin {spin.get('name', 'unknown')}")
+                    continue
+
+                iso_item = {
+                    "sha256": iso_info.get("sha256", ""),
+                    "size": int(iso_info.get("size", 0))
+                }
+
+                # Aliases include the release name for main versions; dedupe
+                # them in order so the output stays stable
+                aliases = [spin_data["version"]]
+                if release_info["release"]:
+                    aliases.append(release_info["release"])
+                aliases = ",".join(dict.fromkeys(aliases))
+
                 for arch in spin_data["architectures"]:
-                    content_id = aggregated_spins[group_name]["content_id"]
-                    product_key = f"{content_id}:{spin_data['image_type']}:{spin_data['version']}:{arch}"
+                    product_key = f"{key_prefix}:{arch}"
+                    path = render_path_template(spin_path, arch=arch)
                     
-                    try:
-                        iso_info = spin["files"]["iso"]
-                        path = iso_info["path_template"] \
-                            .replace("{{ release }}", spin_data["release"]) \
-                            .replace("{{ name }}", spin["name"]) \
-                            .replace("{{ version }}", spin_data["version"]) \
-                            .replace("{{ image_type }}", spin_data["image_type"]) \
-                            .replace("{{ arch }}", arch)
-                        
-                        if product_key not in aggregated_spins[group_name]["products"]:
-                            # Create aliases including release name for main versions
-                            aliases = [spin_data["version"]]
-                            if release_info["release"]:
-                                aliases.append(release_info["release"])
-                            
-                            aggregated_spins[group_name]["products"][product_key] = {
-                                "aliases": ",".join(aliases),
-                                "arch": arch,
-                                "image_type": spin_data["image_type"],
-                                "os": spin["name"],
-                                "release": release_info["release"],
-                                "release_codename": release_info["release_codename"],
-                                "release_title": spin_data["release_title"],
-                                "version": spin_data["version"],
-                                "versions": {}
-                            }
-                        
-                        # Add version information
-                        aggregated_spins[group_name]["products"][product_key]["versions"][spin_data["version"]] = {
-                            "items": {
-                                "iso": {
-                                    "ftype": "iso",
-                                    "path": path,
-                                    "sha256": iso_info.get("sha256", ""),
-                                    "size": int(iso_info.get("size", 0))
-                                }
+                    if product_key not in products:
+                        products[product_key] = {
+                            "aliases": aliases,
+                            "arch": arch,
+                            "image_type": spin_data["image_type"],
+                            "os": spin["name"],
+                            "release": release_info["release"],
+                            "release_codename": release_info["release_codename"],
+                            "release_title": spin_data["release_title"],
+                            "version": spin_data["version"],
+                            "versions": {}
+                        }
+                    
+                    # Add version information
+                    products[product_key]["versions"][spin_data["version"]] = {
+                        "items": {
+                            "iso": {
+                                "ftype": "iso",
+                                "path": path,
+                                **iso_item
                             }
                         }
-                        
-                    except KeyError as e:
-                        print(f"Warning: Missing required field {e} in spin {spin.get('name', 'unknown')}")
-                        continue
+                    }
     
     return dict(aggregated_spins)
 
+def dump_json(data):
+    """Serialize data exactly like json.dumps(data, indent=2), as bytes."""
+    if orjson is not None:
+        try:
+            output = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+        except orjson.JSONEncodeError:
+            # e.g. non-string keys, which json converts but orjson rejects
+            output = None
+        # json escapes non-ASCII characters and orjson doesn't, so only use
+        # orjson's output when the two are guaranteed to be identical
+        if output is not None and output.isascii():
+            return output
+    return json.dumps(data, indent=2).encode('utf-8')
+
 def main():
     parser = argparse.ArgumentParser(description='Generate consolidated ISO JSONs from version YAMLs')
     parser.add_argument('--versions-dir', default='config/versions',
@@ -155,8 +187,17 @@ def main():
     for group_name, group_data in aggregated_data.items():
         if group_data["products"]:
             output_file = os.path.join(args.output_dir, f"{group_name}.json")
-            with open(output_file, 'w') as f:
-                json.dump(group_data, f, indent=2)
+            output = dump_json(group_data)
+            # Leave unchanged files alone so their mtime isn't bumped
+            try:
+                with open(output_file, 'rb') as f:
+                    if f.read() == output:
+                        logger.info(f"Unchanged, not rewriting {output_file}")
+                        continue
+            except FileNotFoundError:
+                pass
+            with open(output_file, 'wb') as f:
+                f.write(output)
         else:
             print(f"Warning: No valid products found for group {group_name}")
 
@@ -1,146 +1,364 @@
 #!/usr/bin/env python3
 
 from ruamel.yaml import YAML
-import requests
-import hashlib
+import functools
+import io
+import json
 import os
 import logging
+import re
+import selectors
+import socket
 from urllib.parse import urljoin
 import argparse
 import shutil
 import subprocess
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+import _ubuntu_common
+from _ubuntu_common import (CACHE_DIR, create_session, load_json_cache, load_sha256sums_cache, lookup_iso,
+                            parse_yaml_file, patch_iso_fields, render_path_template, save_json_cache,
+                            save_sha256sums_cache, sha256_hasher, size_and_sha256, write_text_atomic)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def load_yaml_config(config_file):
-    """Load YAML configuration file."""
+# Maximum number of ISO downloads running at the same time
+MAX_DOWNLOAD_WORKERS = 4
+
+# Shared by all downloads so connections to the CDN are kept alive
+SESSION = create_session(MAX_DOWNLOAD_WORKERS)
+
+# ETag (or Last-Modified), size and SHA256 of ISOs downloaded by previous runs,
+# so an ISO that hasn't changed is confirmed with a HEAD request instead of a download
+ISO_ETAG_CACHE_FILE = CACHE_DIR / 'iso_etags.json'
+_iso_etag_cache = {}
+_iso_etag_lock = threading.Lock()
+
+def load_iso_etag_cache():
+    """Load the ETags of ISOs downloaded by previous runs."""
+    entries = load_json_cache(ISO_ETAG_CACHE_FILE)
+    with _iso_etag_lock:
+        _iso_etag_cache.update(entries)
+
+def save_iso_etag_cache():
+    """Persist the ETags of downloaded ISOs for the next run, keeping those of other configs."""
+    with _iso_etag_lock:
+        if not _iso_etag_cache:
+            return
+        entries = dict(_iso_etag_cache)
+    save_json_cache(ISO_ETAG_CACHE_FILE, entries)
+
+def iso_validator(headers):
+    """Get the header that changes whenever the file does: the ETag, or failing that Last-Modified."""
+    return headers.get('ETag') or headers.get('Last-Modified')
+
+def fetch_unchanged_info(iso_url, iso_info):
+    """
+    Check with a HEAD request whether an ISO is still the one a previous
+    run downloaded and whose size and SHA256 are in the config.
+    Returns (size, sha256) if it is, otherwise None.
+    """
+    with _iso_etag_lock:
+        cached = _iso_etag_cache.get(iso_url)
+    if not cached or not iso_info.get('sha256') or cached['sha256'] != iso_info['sha256']:
+        return None
+
+    try:
+        response = SESSION.head(iso_url, allow_redirects=True, timeout=10)
+    except Exception as e:
+        logger.debug(f"HEAD request for {iso_url} failed: {e}")
+        return None
+
+    etag = iso_validator(response.headers)
+    size = int(response.headers.get('content-length', 0))
+    if response.ok and etag and etag == cached['validator'] and size == cached['size'] == iso_info.get('size'):
+        return size, iso_info['sha256']
+    return None
+
+def create_yaml_handler():
+    """Create a round-trip YAML handler matching the config file style."""
     yaml = YAML()
     yaml.preserve_quotes = True
     yaml.indent(mapping=2, sequence=4, offset=2)
-    
+    return yaml
+
+def load_yaml_config(config_file):
+    """
+    Load YAML configuration file as plain data. Uses the fast LibYAML
+    parser; the slow round-trip parser is only needed to write updates.
+    """
     if not os.path.exists(config_file):
         raise FileNotFoundError(f"Config file not found: {config_file}")
     
-    with open(config_file, 'r') as f:
-        return yaml.load(f)
+    return parse_yaml_file(config_file)
 
 def save_yaml_config(config_file, new_data):
-    """Save only SHA256 and size updates to config."""
-    yaml = YAML()
-    yaml.preserve_quotes = True
-    yaml.indent(mapping=2, sequence=4, offset=2)
+    """
+    Save only SHA256 and size updates to config. The round-trip parse is
+    only used to find the lines to change; those lines are rewritten in
+    place, so the rest of the file keeps its formatting.
+    """
+    yaml = create_yaml_handler()
     
     with open(config_file, 'r') as f:
-        data = yaml.load(f)
+        text = f.read()
+    data = yaml.load(text)
     
     # Only update SHA256 and size values
+    updates = []
     for group_name, group in new_data['spin_groups'].items():
-        if group_name in data['spin_groups']:
-            for new_spin in group['spins']:
-                for spin in data['spin_groups'][group_name]['spins']:
-                    if spin['name'] == new_spin['name']:
-                        if 'files' in new_spin and 'iso' in new_spin['files']:
-                            if 'sha256' in new_spin['files']['iso']:
-                                spin['files']['iso']['sha256'] = new_spin['files']['iso']['sha256']
-                            if 'size' in new_spin['files']['iso']:
-                                spin['files']['iso']['size'] = new_spin['files']['iso']['size']
+        existing = data['spin_groups'].get(group_name)
+        if not existing:
+            continue
+        # Index the spins by name once instead of scanning them for every update;
+        # like the scan did, a name that occurs twice updates every spin with it
+        spins_by_name = {}
+        for spin in existing['spins']:
+            spins_by_name.setdefault(spin['name'], []).append(spin)
+        for new_spin in group['spins']:
+            try:
+                new_iso = new_spin['files']['iso']
+            except KeyError:
+                continue
+            for spin in spins_by_name.get(new_spin['name'], ()):
+                try:
+                    iso = spin['files']['iso']
+                except KeyError:
+                    continue
+                if any(key in new_iso and iso.get(key) != new_iso[key] for key in ('sha256', 'size')):
+                    updates.append((iso, new_iso.get('sha256', iso.get('sha256')),
+                                    new_iso.get('size', iso.get('size'))))
     
-    with open(config_file, 'w') as f:
-        yaml.dump(data, f)
+    # Re-running on an up to date version changes nothing, so leave the file alone
+    if not updates:
+        logger.info(f"{config_file} is already up to date")
+        return
+
+    patched = patch_iso_fields(text, updates)
+    if patched is not None:
+        write_text_atomic(config_file, patched)
+        return
+
+    # A field couldn't be located, so let ruamel write the whole file
+    for iso, sha256, size in updates:
+        iso['sha256'] = sha256
+        iso['size'] = size
+    write_yaml_config(config_file, data)
+
+def write_yaml_config(config_file, data):
+    """Write round-trip loaded config data back to its file."""
+    # ruamel emits many tiny writes, so collect them and write the file once
+    buffer = io.StringIO()
+    create_yaml_handler().dump(data, buffer)
+    write_text_atomic(config_file, buffer.getvalue())
+
+# Read size used when streaming downloads
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# (connect, read) timeouts for downloads, so a stalled mirror can't hang the
+# run; the read timeout applies to each read, not to the whole download
+DOWNLOAD_TIMEOUT = (5, 60)
 
-def download_with_progress(url, output_path):
-    """Download file with progress tracking."""
+# Live progress only makes sense on a terminal, and only for a single
+# download at a time; otherwise there's a log line every 10%
+PROGRESS = sys.stdout.isatty()
+
+# Minimum seconds between live progress updates
+PROGRESS_INTERVAL = 0.5
+
+def download_and_hash(url, name, live_progress=False):
+    """
+    Download a file and hash it as it arrives, without storing it.
+    live_progress redraws a progress line on the terminal, which is only
+    readable when no other download is running at the same time.
+    Returns (size, sha256), or None if the download failed.
+    """
+    live_progress = live_progress and PROGRESS
     try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        total_size = int(response.headers.get('content-length', 0))
-        
-        with open(output_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        return True
+        # ISOs don't compress, so don't ask for an encoding that would need decoding
+        with SESSION.get(url, stream=True, headers={'Accept-Encoding': 'identity'},
+                         timeout=DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            total_size = int(response.headers.get('content-length', 0))
+            sha256_hash = sha256_hasher()
+            downloaded = 0
+            # Compare byte counts per chunk; percentages are only worked out when logging
+            next_log_percent = 10
+            next_log_at = -(-total_size * next_log_percent // 100)
+            next_update = 0.0
+
+            # Read straight from the connection into one reused buffer and hash it
+            # there, so the ISO is never written to disk and read back, and no
+            # new bytes object is created per chunk
+            raw = response.raw
+            raw.decode_content = True
+            view = memoryview(bytearray(DOWNLOAD_CHUNK_SIZE))
+            while n := raw.readinto(view):
+                sha256_hash.update(view[:n])
+                downloaded += n
+                if not total_size:
+                    continue
+                if live_progress:
+                    # Redrawing for every chunk would flood the terminal
+                    now = time.monotonic()
+                    if now >= next_update or downloaded == total_size:
+                        percent = downloaded * 100 // total_size
+                        print(f"\r{name}: {percent}% ({downloaded // (1024 * 1024)} MiB)", end='', flush=True)
+                        next_update = now + PROGRESS_INTERVAL
+                elif downloaded >= next_log_at:
+                    percent = downloaded * 100 // total_size
+                    logger.info(f"{name}: {percent}% downloaded")
+                    next_log_percent = percent // 10 * 10 + 10
+                    next_log_at = -(-total_size * next_log_percent // 100)
+            if live_progress and total_size:
+                print()
+            if total_size and downloaded != total_size:
+                raise IOError(f"got {downloaded} of {total_size} bytes")
+            sha256 = sha256_hash.hexdigest()
+
+            etag = iso_validator(response.headers)
+            if etag:
+                with _iso_etag_lock:
+                    _iso_etag_cache[url] = {'validator': etag, 'size': downloaded, 'sha256': sha256}
+            return downloaded, sha256
     except Exception as e:
         logger.error(f"Download failed: {e}")
-        return False
+        return None
 
 def calculate_sha256(file_path):
     """Calculate SHA256 hash of file."""
-    sha256_hash = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest()
+    return size_and_sha256(file_path)[1]
+
+@functools.lru_cache(maxsize=None)
+def transmission_available():
+    """Check once per process whether transmission-cli is installed."""
+    return shutil.which('transmission-cli') is not None
+
+# transmission-cli keeps seeding once a download completes, so it has to
+# be stopped after it reports seeding
+TORRENT_TIMEOUT = 3600  # 1 hour
+TORRENT_LOG_INTERVAL = 30
+TORRENT_STATUS_SEPARATOR = re.compile(rb'[\r\n]')
+
+def wait_for_torrent(process, timeout=TORRENT_TIMEOUT):
+    """
+    Follow transmission-cli's status output until it starts seeding, i.e.
+    the download is complete. Returns False if it exits or times out first.
+    """
+    deadline = time.monotonic() + timeout
+    next_log = time.monotonic() + TORRENT_LOG_INTERVAL
+    pending = b''
+    with selectors.DefaultSelector() as selector:
+        selector.register(process.stdout, selectors.EVENT_READ)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.error(f"Torrent download timed out after {timeout}s")
+                return False
+            if not selector.select(timeout=remaining):
+                continue
+            chunk = os.read(process.stdout.fileno(), 65536)
+            if not chunk:
+                return False
+            # Status lines are redrawn with \r, so split on both line endings
+            *lines, pending = TORRENT_STATUS_SEPARATOR.split(pending + chunk)
+            status = next((line for line in reversed(lines) if line.strip()), None)
+            if status is None:
+                continue
+            if status.startswith(b'Seeding'):
+                return True
+            if time.monotonic() >= next_log:
+                logger.info(status.decode(errors='replace').strip())
+                next_log = time.monotonic() + TORRENT_LOG_INTERVAL
+
+def free_port():
+    """Ask the OS for a TCP port that nothing is listening on."""
+    with socket.socket() as s:
+        s.bind(('', 0))
+        return s.getsockname()[1]
 
 def download_torrent(url, output_dir):
     """Download using transmission-cli."""
+    torrent_path = os.path.join(output_dir, "temp.torrent")
+    process = None
     try:
-        torrent_path = os.path.join(output_dir, "temp.torrent")
-        kill_script = os.path.join(output_dir, "kill_transmission.sh")
+        # .torrent files are small, so read the whole response at once
+        response = SESSION.get(url, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        with open(torrent_path, 'wb') as f:
+            f.write(response.content)
         
-        if not download_with_progress(url, torrent_path):
+        # Torrents can download at the same time, so each transmission-cli
+        # gets its own settings/resume directory and its own peer port
+        # instead of sharing ~/.config/transmission-cli and port 51413
+        process = subprocess.Popen(['transmission-cli',
+                                    '-g', os.path.join(output_dir, 'transmission'),
+                                    '-p', str(free_port()),
+                                    '-w', output_dir,
+                                    '--no-portmap',
+                                    '--download-dir', output_dir,
+                                    torrent_path],
+                                   stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT)
+        if not wait_for_torrent(process):
             return None
         
-        # Create kill script that waits for download completion
-        with open(kill_script, 'w') as f:
-            f.write("""#!/bin/bash
-killall transmission-cli
-""")
-        os.chmod(kill_script, 0o755)
-            
-        subprocess.run(['transmission-cli', 
-                       '-f', kill_script,
-                       '-w', output_dir,
-                       '--no-portmap',
-                       '--download-dir', output_dir,
-                       torrent_path], 
-                      check=False,
-                      timeout=3600)  # 1 hour timeout
-        
         # Find downloaded ISO
-        isos = [f for f in os.listdir(output_dir) if f.endswith('.iso')]
-        return os.path.join(output_dir, isos[0]) if isos else None
+        with os.scandir(output_dir) as entries:
+            iso = next((entry for entry in entries if entry.name.endswith('.iso')), None)
+        return iso.path if iso else None
     except Exception as e:
         logger.error(f"Torrent download failed: {e}")
         return None
     finally:
+        if process is not None:
+            # Stops only this transmission-cli, so other torrents downloading
+            # at the same time carry on
+            if process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+            process.stdout.close()
         if os.path.exists(torrent_path):
             os.unlink(torrent_path)
-        if os.path.exists(kill_script):
-            os.unlink(kill_script)
 
 def update_iso_info(config_data, iso_path):
     """Update ISO information in config."""
-    size = os.path.getsize(iso_path)
-    sha256 = calculate_sha256(iso_path)
+    size, sha256 = size_and_sha256(iso_path)
     
     for group in config_data['spin_groups'].values():
         for spin in group['spins']:
-            if 'files' in spin and 'iso' in spin['files']:
-                spin['files']['iso']['size'] = size
-                spin['files']['iso']['sha256'] = sha256
-                return True
+            try:
+                iso = spin['files']['iso']
+            except KeyError:
+                continue
+            iso['size'] = size
+            iso['sha256'] = sha256
+            return True
     return False
 
 def get_iso_url(spin, version):
     """Get the correct ISO URL based on spin type"""
-    base_url = spin['files']['iso']['url'].rstrip('/')
-    
-    # Extract filename from template
-    filename = spin['files']['iso']['path_template'].split('/')[-1] \
-        .replace('{{ version }}', version) \
-        .strip('"')
-    
-    # Construct path with version and release
-    path = f"{version}/release/{filename}"
-    
-    # Construct final URL
-    full_url = f"{base_url}/{path}"
-    
-    # Fix up URL to ensure proper formatting
-    return full_url.replace('//', '/').replace('http:/', 'http://').replace('https:/', 'https://')
+    iso_info = spin['files']['iso']
+    base_url = iso_info['url'].rstrip('/')
+
+    # Fill in the filename part of the template in a single pass
+    filename = render_path_template(iso_info['path_template'].split('/')[-1], version=version).strip('"')
+
+    # Older configs point at the releases directory instead of the release itself
+    release_dir = f"{version}/release"
+    if not base_url.endswith(f"/{release_dir}"):
+        base_url = f"{base_url}/{release_dir}"
+
+    return f"{base_url}/{filename}"
 
 def get_torrent_url(spin, version):
     """Get the correct torrent URL for a spin"""
@@ -151,64 +369,171 @@ def get_torrent_url(spin, version):
         return None
     return f"{iso_url}.torrent"
 
+def fetch_published_info(spin, version):
+    """
+    Look up a spin's ISO in the SHA256SUMS file published next to it.
+    Returns (size, sha256), or None if the ISO isn't listed or its size is unknown.
+    """
+    base_url, iso_filename = get_iso_url(spin, version).rsplit('/', 1)
+    checksums, size = lookup_iso(SESSION, base_url, iso_filename)
+    if not size:
+        return None
+    return size, checksums[iso_filename]['sha256']
+
+def fetch_iso_info(spin, version, use_torrent, work_dir, force_download=False, live_progress=False):
+    """
+    Get a spin's ISO size and SHA256, from the published SHA256SUMS if
+    possible, otherwise by downloading the ISO and measuring it.
+    Returns (size, sha256), or None if the download failed.
+    """
+    logger.info(f"Processing {spin['name']} {version}")
+
+    if not force_download:
+        info = fetch_published_info(spin, version)
+        if info:
+            logger.info(f"Found {spin['name']} {version} in the published SHA256SUMS")
+            return info
+        info = fetch_unchanged_info(get_iso_url(spin, version), spin['files']['iso'])
+        if info:
+            logger.info(f"{spin['name']} {version} is unchanged since it was last downloaded")
+            return info
+        logger.info(f"{spin['name']} {version} not in a published SHA256SUMS, downloading the ISO")
+
+    if not use_torrent:
+        iso_url = get_iso_url(spin, version)
+        logger.info(f"Using direct ISO URL: {iso_url}")
+        return download_and_hash(iso_url, f"{spin['name']}-{version}.iso", live_progress)
+
+    torrent_url = get_torrent_url(spin, version)
+    if not torrent_url:
+        return None
+    logger.info(f"Using torrent URL: {torrent_url}")
+    # The download is found by scanning its directory for an ISO, so every
+    # spin gets a directory of its own
+    output_dir = os.path.join(work_dir, spin['name'])
+    os.makedirs(output_dir, exist_ok=True)
+    try:
+        iso_path = download_torrent(torrent_url, output_dir)
+        if not iso_path:
+            return None
+        return size_and_sha256(iso_path)
+    finally:
+        # Free the space as soon as the spin is hashed, including anything
+        # an interrupted download left behind, instead of after the last spin
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+def run(config_path=None, spins=None, use_torrent=False, work_dir='/tmp/iso-work', config_dict=None,
+        force_download=False, jobs=MAX_DOWNLOAD_WORKERS):
+    """
+    Update ISO SHA256 and size for one version config.
+
+    Works on config_dict if given, otherwise loads config_path. Updates are
+    saved back to config_path when it is set. Returns the updated config
+    data, or None if the config couldn't be processed.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        config_data = config_dict if config_dict is not None else load_yaml_config(config_path)
+        version = config_data.get('version')
+        if not version:
+            logger.error("No version specified in config")
+            return None
+
+        spin_groups = config_data['spin_groups']
+
+        # If specific spins requested, only process those
+        if spins:
+            missing = [s for s in spins if s not in spin_groups]
+            present = [s for s in spins if s in spin_groups]
+            if not present:
+                logger.error(f"Spin(s) {', '.join(missing)} not found in config")
+                return None
+            if missing:
+                # A config needn't carry every spin, so update the ones it has
+                logger.warning(f"Spin(s) {', '.join(missing)} not found in config, skipping")
+            spin_groups = {s: spin_groups[s] for s in present}
+
+        if use_torrent and not transmission_available():
+            logger.warning("transmission-cli not found, downloading ISOs directly instead")
+            use_torrent = False
+
+        spins_to_process = [spin for group in spin_groups.values() for spin in group['spins']]
+
+        # Downloads are network-bound and independent of each other
+        workers = max(1, jobs)
+        # Progress lines from concurrent downloads would overwrite each other
+        live_progress = min(workers, len(spins_to_process)) == 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(
+                lambda spin: fetch_iso_info(spin, version, use_torrent, work_dir, force_download,
+                                            live_progress),
+                spins_to_process
+            ))
+
+        # Apply the results here so only this thread touches the config data
+        updated = False
+        for spin, result in zip(spins_to_process, results):
+            if result:
+                spin['files']['iso']['size'], spin['files']['iso']['sha256'] = result
+                updated = True
+
+        if not updated:
+            logger.info(f"No ISO information updated for {version}")
+        elif config_path:
+            # Merge the updates into a round-trip load of the file, so its
+            # quoting and layout are kept
+            save_yaml_config(config_path, {'spin_groups': spin_groups})
+        return config_data
+                
+    finally:
+        # Every spin cleans up its own directory, so this is empty unless
+        # the directory was shared with something else
+        try:
+            os.rmdir(work_dir)
+        except OSError:
+            pass
+
 def main():
     parser = argparse.ArgumentParser(description='Update Ubuntu ISO information')
-    parser.add_argument('--config', required=True, help='Path to YAML config file')
-    parser.add_argument('--spin', help='Update specific spin only')
+    parser.add_argument('--config', required=True, nargs='+', help='Path(s) to YAML config file(s)')
+    parser.add_argument('--spin', help='Update specific spin(s) only, comma-separated (e.g., kubuntu,xubuntu)')
     parser.add_argument('--use-torrent', action='store_true', help='Use torrent for downloading')
     parser.add_argument('--work-dir', default='/tmp/iso-work', help='Working directory')
+    parser.add_argument('--jobs', type=int, default=MAX_DOWNLOAD_WORKERS,
+                        help=f'Number of ISOs to download at the same time (default: {MAX_DOWNLOAD_WORKERS})')
+    parser.add_argument('--force-download', action='store_true',
+                        help='Download and hash every ISO instead of using the published SHA256SUMS')
     parser.add_argument('-v', '--verbose', action='store_true', help='Verbose output')
     args = parser.parse_args()
 
     if args.verbose:
         logger.setLevel(logging.DEBUG)
+        _ubuntu_common.logger.setLevel(logging.DEBUG)
 
-    os.makedirs(args.work_dir, exist_ok=True)
-    try:
-        config_data = load_yaml_config(args.config)
-        version = config_data.get('version')
-        if not version:
-            logger.error("No version specified in config")
-            return
+    spins = None
+    if args.spin:
+        spins = [s.strip() for s in args.spin.split(',') if s.strip()]
 
-        # If specific spin requested, filter config data
-        if args.spin:
-            if args.spin not in config_data['spin_groups']:
-                logger.error(f"Spin {args.spin} not found in config")
-                return
-            filtered_groups = {args.spin: config_data['spin_groups'][args.spin]}
-            config_data['spin_groups'] = filtered_groups
-
-        for group_name, group in config_data['spin_groups'].items():
-            for spin in group['spins']:
-                logger.info(f"Processing {spin['name']} {version}")
-                
-                if args.use_torrent:
-                    torrent_url = get_torrent_url(spin, version)
-                    if torrent_url:
-                        logger.info(f"Using torrent URL: {torrent_url}")
-                        downloaded_path = download_torrent(torrent_url, args.work_dir)
-                        if downloaded_path:
-                            size = os.path.getsize(downloaded_path)
-                            sha256 = calculate_sha256(downloaded_path)
-                            spin['files']['iso']['size'] = size
-                            spin['files']['iso']['sha256'] = sha256
-                            os.unlink(downloaded_path)
-                else:
-                    iso_url = get_iso_url(spin, version)
-                    iso_path = os.path.join(args.work_dir, f"{spin['name']}-{version}.iso")
-                    logger.info(f"Using direct ISO URL: {iso_url}")
-                    if download_with_progress(iso_url, iso_path):
-                        size = os.path.getsize(iso_path)
-                        sha256 = calculate_sha256(iso_path)
-                        spin['files']['iso']['size'] = size
-                        spin['files']['iso']['sha256'] = sha256
-                        os.unlink(iso_path)
-        
-        save_yaml_config(args.config, config_data)
-                
+    if args.jobs > MAX_DOWNLOAD_WORKERS:
+        # Size the connection pool so every download can keep its connection
+        global SESSION
+        SESSION = create_session(args.jobs)
+
+    if not args.force_download:
+        load_sha256sums_cache()
+        load_iso_etag_cache()
+
+    # Process every config in this interpreter; a failing config doesn't stop the rest
+    try:
+        for config_file in args.config:
+            try:
+                run(config_path=config_file, spins=spins, use_torrent=args.use_torrent,
+                    work_dir=args.work_dir, force_download=args.force_download, jobs=args.jobs)
+            except Exception as e:
+                logger.warning(f"Failed to process {config_file}: {e}")
     finally:
-        shutil.rmtree(args.work_dir, ignore_errors=True)
+        save_sha256sums_cache()
+        save_iso_etag_cache()
 
 if __name__ == '__main__':
     main()
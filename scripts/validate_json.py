@@ -4,27 +4,141 @@ Validate generated JSON files against the expected schema.
 Ensures compatibility with netboot.xyz mini-iso-tools.
 """
 
+import argparse
+import contextlib
+import functools
+import hashlib
+import io
 import json
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-REQUIRED_TOP_LEVEL = ['datatype', 'format', 'content_id', 'products']
-REQUIRED_PRODUCT = ['aliases', 'arch', 'image_type', 'os', 'release',
-                   'release_codename', 'release_title', 'version', 'versions']
-REQUIRED_ISO = ['ftype', 'path', 'sha256', 'size']
+# fastjsonschema is optional; it compiles the schema to Python code that
+# checks a valid file far faster than walking it field by field
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+# orjson is optional; it parses much faster than the json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from _ubuntu_common import CACHE_DIR, load_json_cache, save_json_cache
+
+REQUIRED_TOP_LEVEL = ('datatype', 'format', 'content_id', 'products')
+REQUIRED_PRODUCT = ('aliases', 'arch', 'image_type', 'os', 'release',
+                    'release_codename', 'release_title', 'version', 'versions')
+REQUIRED_ISO = ('ftype', 'path', 'sha256', 'size')
+
+_REQUIRED_TOP_LEVEL_SET = frozenset(REQUIRED_TOP_LEVEL)
+_REQUIRED_PRODUCT_SET = frozenset(REQUIRED_PRODUCT)
+_REQUIRED_ISO_SET = frozenset(REQUIRED_ISO)
+
+# Everything validate_json_file() reports as an error, as a JSON Schema.
+# Empty checksums and sizes are only warnings, so they aren't part of it.
+SCHEMA = {
+    'type': 'object',
+    'required': list(REQUIRED_TOP_LEVEL),
+    'properties': {
+        'format': {'const': 'products:1.0'},
+        'datatype': {'const': 'image-downloads'},
+        'products': {
+            'type': 'object',
+            'minProperties': 1,
+            'additionalProperties': {
+                'type': 'object',
+                'required': list(REQUIRED_PRODUCT),
+                'properties': {
+                    'versions': {
+                        'type': 'object',
+                        'minProperties': 1,
+                        'additionalProperties': {
+                            'type': 'object',
+                            'required': ['items'],
+                            'properties': {
+                                'items': {
+                                    'type': 'object',
+                                    'required': ['iso'],
+                                    'properties': {
+                                        'iso': {
+                                            'type': 'object',
+                                            'required': list(REQUIRED_ISO),
+                                            'properties': {
+                                                'ftype': {'const': 'iso'},
+                                            },
+                                        },
+                                    },
+                                },
+                            },
+                        },
+                    },
+                },
+            },
+        },
+    },
+}
+
+@functools.lru_cache(maxsize=1)
+def get_schema_validator():
+    """
+    Compile SCHEMA once per process, on first use, and share the result
+    between all files. Returns None if fastjsonschema isn't installed.
+    """
+    if fastjsonschema is None:
+        return None
+    return fastjsonschema.compile(SCHEMA)
+
+def missing_fields(required, required_set, mapping):
+    """List the required fields a mapping lacks, in the order they're listed in required."""
+    # A single set difference in C; the ordered list is only built when something is missing
+    missing = required_set.difference(mapping)
+    return [f for f in required if f in missing] if missing else []
+
+def check_iso_values(product_id, version, iso, warnings):
+    """Warn about ISO entries whose checksum or size haven't been filled in."""
+    if iso.get('sha256') == '':
+        warnings.append(f"Product {product_id} version {version} has empty SHA256")
+
+    if iso.get('size', 0) == 0:
+        warnings.append(f"Product {product_id} version {version} has zero size")
 
 def validate_json_file(json_path):
     """Validate a single JSON file."""
     errors = []
     warnings = []
 
-    with open(json_path, 'r') as f:
-        data = json.load(f)
+    raw = Path(json_path).read_bytes()
+    try:
+        data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    except ValueError as e:
+        # Both libraries' decode errors are ValueErrors
+        errors.append(f"Invalid JSON: {e}")
+        return errors, warnings
+
+    # A file that matches the schema has no errors, so only the warnings
+    # need a pass over it. Otherwise walk it below to describe the errors.
+    validate = get_schema_validator()
+    if validate is not None:
+        try:
+            validate(data)
+        except fastjsonschema.JsonSchemaException:
+            pass
+        else:
+            products = data['products']
+            print(f"  Found {len(products)} products")
+            for product_id, product in products.items():
+                for version, version_data in product['versions'].items():
+                    check_iso_values(product_id, version, version_data['items']['iso'], warnings)
+            return errors, warnings
 
     # Check top-level fields
-    for field in REQUIRED_TOP_LEVEL:
-        if field not in data:
-            errors.append(f"Missing top-level field: {field}")
+    for field in missing_fields(REQUIRED_TOP_LEVEL, _REQUIRED_TOP_LEVEL_SET, data):
+        errors.append(f"Missing top-level field: {field}")
 
     # Validate expected format
     if data.get('format') != 'products:1.0':
@@ -44,7 +158,7 @@ def validate_json_file(json_path):
     # Validate each product
     for product_id, product in products.items():
         # Check product fields
-        missing = [f for f in REQUIRED_PRODUCT if f not in product]
+        missing = missing_fields(REQUIRED_PRODUCT, _REQUIRED_PRODUCT_SET, product)
         if missing:
             errors.append(f"Product {product_id} missing fields: {missing}")
 
@@ -66,16 +180,12 @@ def validate_json_file(json_path):
             iso = version_data['items']['iso']
 
             # Check ISO fields
-            missing_iso = [f for f in REQUIRED_ISO if f not in iso]
+            missing_iso = missing_fields(REQUIRED_ISO, _REQUIRED_ISO_SET, iso)
             if missing_iso:
                 errors.append(f"Product {product_id} version {version} ISO missing: {missing_iso}")
 
             # Check for empty values
-            if iso.get('sha256') == '':
-                warnings.append(f"Product {product_id} version {version} has empty SHA256")
-
-            if iso.get('size', 0) == 0:
-                warnings.append(f"Product {product_id} version {version} has zero size")
+            check_iso_values(product_id, version, iso, warnings)
 
             # Validate ftype
             if iso.get('ftype') != 'iso':
@@ -83,46 +193,155 @@ def validate_json_file(json_path):
 
     return errors, warnings
 
+# Below this much JSON in total, starting worker processes costs more than it saves
+PARALLEL_MIN_BYTES = 32 * 1024 * 1024
+
+def validate_json_file_captured(json_path):
+    """Validate a single JSON file, returning what it printed along with the results."""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        errors, warnings = validate_json_file(json_path)
+    return output.getvalue(), errors, warnings
+
+def validate_json_files(json_files):
+    """
+    Validate files, yielding (output, errors, warnings) in the same order.
+    Large batches are spread over all CPU cores.
+    """
+    total_size = sum(json_file.stat().st_size for json_file in json_files)
+    if len(json_files) > 1 and total_size >= PARALLEL_MIN_BYTES and (os.cpu_count() or 1) > 1:
+        with ProcessPoolExecutor() as executor:
+            try:
+                yield from executor.map(validate_json_file_captured, json_files)
+            finally:
+                # Don't wait for files that won't be reported if the caller stops early
+                executor.shutdown(cancel_futures=True)
+    else:
+        yield from map(validate_json_file_captured, json_files)
+
+# Results for file contents validated by previous runs, so unchanged
+# output files aren't parsed and checked again
+RESULT_CACHE_FILE = CACHE_DIR / 'validate_json.json'
+
+@functools.lru_cache(maxsize=1)
+def checks_fingerprint():
+    """Hash this script, so changing the checks invalidates cached results."""
+    return hashlib.blake2b(Path(__file__).read_bytes(), digest_size=16).digest()
+
+def result_cache_key(json_path):
+    """Key a file's cached result on its content and the checks it went through."""
+    digest = hashlib.blake2b(checks_fingerprint(), digest_size=16)
+    digest.update(Path(json_path).read_bytes())
+    return digest.hexdigest()
+
+def load_result_cache():
+    """Load validation results saved by previous runs."""
+    return load_json_cache(RESULT_CACHE_FILE)
+
+def cached_result(cache, name, key):
+    """Return a file's cached (output, errors, warnings) if they're for its current content."""
+    entry = cache.get(name)
+    if isinstance(entry, list) and len(entry) == 4 and entry[0] == key:
+        return entry[1:]
+    return None
+
+def save_result_cache(entries):
+    """Persist validation results for the next run, replacing those of files no longer present."""
+    save_json_cache(RESULT_CACHE_FILE, entries, merge=False)
+
+def format_report(name, output, errors, warnings):
+    """Render a file's validation results for people reading the log."""
+    lines = [f"📄 {name}\n", output]
+
+    if errors:
+        lines.append(f"  ❌ {len(errors)} errors:\n")
+        lines.extend(f"     - {err}\n" for err in errors)
+    else:
+        lines.append(f"  ✅ No errors\n")
+
+    if warnings:
+        lines.append(f"  ⚠️  {len(warnings)} warnings:\n")
+        lines.extend(f"     - {warn}\n" for warn in warnings)
+
+    lines.append("\n")
+    return ''.join(lines)
+
+def format_json_line(record):
+    """Render a record as one line of JSON, for tools reading the output."""
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
 def main():
+    parser = argparse.ArgumentParser(description='Validate generated JSON files against the expected schema')
+    parser.add_argument('--fail-fast', action='store_true',
+                       help='Stop at the first file with errors')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Validate every file, ignoring results cached by previous runs')
+    parser.add_argument('--json', action='store_true',
+                       help='Print one JSON object per file and a totals object, instead of a report')
+    args = parser.parse_args()
+
     output_dir = Path('output')
 
     if not output_dir.exists():
         print(f"Error: {output_dir} does not exist")
         sys.exit(1)
 
-    json_files = list(output_dir.glob('*.json'))
+    # DirEntry.is_file() uses the type from the directory listing, no stat needed
+    with os.scandir(output_dir) as entries:
+        json_files = sorted(Path(entry.path) for entry in entries
+                            if entry.name.endswith('.json') and entry.is_file())
     if not json_files:
         print(f"Error: No JSON files found in {output_dir}")
         sys.exit(1)
 
-    print(f"Validating {len(json_files)} JSON files...\n")
+    if not args.json:
+        print(f"Validating {len(json_files)} JSON files...\n")
 
     all_errors = []
     all_warnings = []
 
-    for json_file in sorted(json_files):
-        print(f"📄 {json_file.name}")
-        errors, warnings = validate_json_file(json_file)
+    # Results are cached per file name along with the key of the content
+    # they're for, so only new or changed files need checking
+    cache = load_result_cache()
+    keys = [result_cache_key(json_file) for json_file in json_files]
+    hits = [None if args.no_cache else cached_result(cache, json_file.name, key)
+            for json_file, key in zip(json_files, keys)]
+    pending = [json_file for json_file, hit in zip(json_files, hits) if hit is None]
 
-        if errors:
-            print(f"  ❌ {len(errors)} errors:")
-            for err in errors:
-                print(f"     - {err}")
-            all_errors.extend(errors)
-        else:
-            print(f"  ✅ No errors")
+    checked = 0
+    with contextlib.closing(validate_json_files(pending)) as fresh_results:
+        for json_file, key, hit in zip(json_files, keys, hits):
+            output, errors, warnings = hit or next(fresh_results)
+            cache[json_file.name] = [key, output, errors, warnings]
 
-        if warnings:
-            print(f"  ⚠️  {len(warnings)} warnings:")
-            for warn in warnings:
-                print(f"     - {warn}")
+            # Each file's results are written in one go
+            if args.json:
+                sys.stdout.write(format_json_line({'file': json_file.name, 'errors': errors,
+                                                   'warnings': warnings}))
+            else:
+                sys.stdout.write(format_report(json_file.name, output, errors, warnings))
+            all_errors.extend(errors)
             all_warnings.extend(warnings)
+            checked += 1
+
+            if errors and args.fail_fast:
+                if not args.json:
+                    print("Stopping at the first file with errors (--fail-fast)\n")
+                break
+
+    # Keep the entries of files --fail-fast didn't get to, but drop those
+    # of files that no longer exist
+    current = {json_file.name for json_file in json_files}
+    save_result_cache({name: entry for name, entry in cache.items() if name in current})
 
-        print()
+    if args.json:
+        sys.stdout.write(format_json_line({'total': checked, 'errors': len(all_errors),
+                                           'warnings': len(all_warnings)}))
+        sys.exit(1 if all_errors else 0)
 
     # Summary
     print("=" * 60)
-    print(f"Total: {len(json_files)} files")
+    print(f"Total: {checked} files")
     print(f"Errors: {len(all_errors)}")
     print(f"Warnings: {len(all_warnings)}")
 